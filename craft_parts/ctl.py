@@ -16,15 +16,86 @@
 
 """Helpers to invoke step execution handlers from the command line."""
 
+import contextlib
 import json
 import logging
 import os
+import shlex
 import socket
 import sys
+import threading
+from collections.abc import Callable, Iterator
+from typing import Any, NoReturn
+
+
+def _stdlib_json_dumps(obj: Any) -> bytes:  # noqa: ANN401
+    """Encode obj as JSON with the standard library encoder."""
+    return json.dumps(obj).encode("utf8")
+
+
+try:
+    from orjson import JSONEncodeError
+    from orjson import dumps as _orjson_dumps
+except ImportError:
+    # orjson is an optional speedup; fall back to the standard library encoder.
+    _json_dumps = _stdlib_json_dumps
+else:
+
+    def _json_dumps(obj: Any) -> bytes:  # noqa: ANN401
+        """Encode obj as JSON with orjson."""
+        try:
+            return _orjson_dumps(obj)
+        except JSONEncodeError:
+            # orjson rejects the surrogate escapes found in arguments that
+            # aren't valid UTF-8, the standard library encoder escapes them.
+            return _stdlib_json_dumps(obj)
+
 
 logger = logging.getLogger(__name__)
 
 
+# Queued batch requests are submitted once their size reaches this limit.
+_BATCH_FLUSH_SIZE = 65536
+
+# Scriptlets always run with the ctl socket defined, resolve it only once.
+_CTL_SOCKET_PATH = os.environ.get("PARTS_CTL_SOCKET")
+
+# Requests start with a record separator, as in JSON text sequences (RFC 7464),
+# so the server can tell them apart from unframed requests sent by older clients.
+_REQUEST_MARKER = b"\x1e"
+
+# Commands handled by the ctl server.
+_COMMANDS = ("default", "get", "set")
+
+# Encoded request prefixes, so only the arguments need to be encoded
+# for each call.
+_REQUEST_PREFIXES = {
+    cmd: _REQUEST_MARKER + b'{"function":' + _json_dumps(cmd) + b',"args":'
+    for cmd in _COMMANDS
+}
+
+
+class _Batch:
+    """Requests queued for submission over a persistent connection."""
+
+    def __init__(self, ctl_socket: socket.socket) -> None:
+        self.ctl_socket = ctl_socket
+        self.payload = bytearray()
+        self.pending = 0
+
+
+class _LocalState(threading.local):
+    """Client state, kept separately for each thread."""
+
+    def __init__(self) -> None:
+        self.batch: _Batch | None = None
+        # Reusable buffer for server responses, to avoid an allocation per read.
+        self.recv_buf = bytearray(4096)
+
+
+_local = _LocalState()
+
+
 class CraftCtl:
     """Client for the craft-parts ctl protocol.
 
@@ -50,6 +121,31 @@ class CraftCtl:
 
         raise RuntimeError(f"invalid command {cmd!r}")
 
+    @classmethod
+    @contextlib.contextmanager
+    def batch(cls) -> Iterator[None]:
+        """Submit the commands run in this context over a single connection.
+
+        Commands that don't return a value are queued and sent to the step
+        processor together when the context exits, when ``get`` is called,
+        or when the queue grows too large. Errors from queued commands are
+        raised when the queue is submitted. Queued commands are discarded
+        if the context exits with an exception.
+
+        :raises RuntimeError: If a queued command fails.
+        """
+        if _local.batch is not None:
+            yield
+            return
+
+        with _connect() as ctl_socket:
+            _local.batch = _Batch(ctl_socket)
+            try:
+                yield
+                _flush(_local.batch)
+            finally:
+                _local.batch = None
+
 
 def _client(cmd: str, args: list[str]) -> str | None:
     """Execute a command in the running step processor.
@@ -64,43 +160,158 @@ def _client(cmd: str, args: list[str]) -> str | None:
 
     :raise RuntimeError: If the command is invalid.
     """
-    try:
-        ctl_socket_path = os.environ["PARTS_CTL_SOCKET"]
-    except KeyError as err:
+    # Requests are marked and newline-terminated, so several of them can
+    # be sent over the same connection.
+    prefix = _REQUEST_PREFIXES.get(cmd)
+    if prefix is None:
+        request = _REQUEST_MARKER + _json_dumps({"function": cmd, "args": args}) + b"\n"
+    else:
+        request = prefix + _json_dumps(args) + b"}\n"
+
+    batch = _local.batch
+    if batch is not None:
+        batch.payload += request
+        batch.pending += 1
+        if cmd == "get" or len(batch.payload) >= _BATCH_FLUSH_SIZE:
+            return _flush(batch)
+        return None
+
+    with _connect() as ctl_socket:
+        ctl_socket.sendall(request)
+        (response,) = _recv_responses(ctl_socket, 1)
+
+    return _parse_response(response)
+
+
+def _connect() -> socket.socket:
+    """Connect to the ctl server of the running step processor.
+
+    :raise RuntimeError: If the ctl socket is not defined.
+    """
+    ctl_socket_path = _CTL_SOCKET_PATH or os.environ.get("PARTS_CTL_SOCKET")
+    if ctl_socket_path is None:
         raise RuntimeError(
-            f"{err!s} environment variable must be defined.\nNote that this "
-            f"utility is designed for use only in part scriptlets."
-        ) from err
+            "'PARTS_CTL_SOCKET' environment variable must be defined.\nNote that "
+            "this utility is designed for use only in part scriptlets."
+        )
 
-    logger.debug(f"ctl socket: {ctl_socket_path}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("ctl socket: %s", ctl_socket_path)
 
-    data = {"function": cmd, "args": args}
     ctl_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    ctl_socket.connect(ctl_socket_path)
-    ctl_socket.send(bytes(json.dumps(data), encoding="utf8"))
-    feedback = ctl_socket.recv(1024).decode("utf8").split(" ", 1)
+    try:
+        ctl_socket.connect(ctl_socket_path)
+    except OSError:
+        ctl_socket.close()
+        raise
 
-    # response from server is in the form "<status> <message>" where
-    # <status> can be either "OK" or "ERR".  Previous server versions
-    # used an empty response as success, anything else was an error
-    # message.
+    return ctl_socket
 
-    status = feedback[0]
-    message = feedback[1].strip() if len(feedback) > 1 else ""
-    retval = None
 
-    logger.debug(f"status: {status}")
+def _flush(batch: _Batch) -> str | None:
+    """Submit queued requests and process their responses.
+
+    :param batch: The batch holding the queued requests.
 
-    if status == "OK":
-        # command has succeeded
-        retval = message
-    elif status == "ERR":
-        # command has failed
-        raise RuntimeError(message)
+    :return: The value returned by the last queued command.
+
+    :raise RuntimeError: If a queued command failed.
+    """
+    if not batch.pending:
+        return None
+
+    batch.ctl_socket.sendall(batch.payload)
+    responses = _recv_responses(batch.ctl_socket, batch.pending)
+    batch.payload.clear()
+    batch.pending = 0
+
+    # All responses have been read at this point, so the connection remains
+    # usable if an error is raised and handled.
+    retval = None
+    for response in responses:
+        retval = _parse_response(response)
 
     return retval
 
 
+def _parse_response(response: bytes) -> str | None:
+    """Obtain the value returned by the ctl server.
+
+    :param response: A single response line.
+
+    :raise RuntimeError: If the server returned an error or an invalid response.
+    """
+    # response from server is in the form "<status> <message>" where
+    # <status> can be either "OK" or "ERR" and <message> is an optional
+    # JSON string.
+
+    status, _, message = response.strip().partition(b" ")
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("status: %s", status.decode())
+
+    handler = _STATUS_HANDLERS.get(status)
+    if handler is None:
+        raise _unexpected_response(response)
+
+    try:
+        value = json.loads(message) if message else ""
+    except ValueError as err:
+        raise _unexpected_response(response) from err
+
+    if not isinstance(value, str):
+        raise _unexpected_response(response)
+
+    return handler(value)
+
+
+def _unexpected_response(response: bytes) -> RuntimeError:
+    """Create the error for a response that doesn't follow the protocol."""
+    return RuntimeError(f"unexpected ctl server response {response!r}")
+
+
+def _status_ok(message: str) -> str:
+    """Return the value of a successful command."""
+    return message
+
+
+def _status_error(message: str) -> NoReturn:
+    """Raise the error of a failed command."""
+    raise RuntimeError(message)
+
+
+_STATUS_HANDLERS: dict[bytes, Callable[[str], str | None]] = {
+    b"OK": _status_ok,
+    b"ERR": _status_error,
+}
+
+
+def _recv_responses(ctl_socket: socket.socket, count: int) -> list[bytes]:
+    """Read newline-terminated responses from the ctl server.
+
+    :param ctl_socket: The socket connected to the ctl server.
+    :param count: The number of responses to read.
+
+    :return: The raw responses.
+
+    :raise RuntimeError: If the server closed the connection before sending
+        all responses.
+    """
+    data = bytearray()
+    received = 0
+    recv_buf = _local.recv_buf
+    while received < count and (nbytes := ctl_socket.recv_into(recv_buf)):
+        data += memoryview(recv_buf)[:nbytes]
+        received += recv_buf.count(b"\n", 0, nbytes)
+
+    if received < count:
+        raise RuntimeError(
+            f"ctl server closed the connection after {received} of {count} responses"
+        )
+
+    return [bytes(line) for line in data.split(b"\n")[:count]]
+
+
 def main() -> None:
     """Run the ctl client cli."""
     if len(sys.argv) < 2:  # noqa: PLR2004
@@ -115,3 +326,33 @@ def main() -> None:
     except RuntimeError:
         logger.exception("error: ")
         sys.exit(1)
+
+
+def main_batch() -> None:
+    """Run ctl client commands read from the standard input.
+
+    Each input line holds a command and its arguments, quoted as in a
+    shell command line. All commands are validated before any of them
+    runs, and are submitted over a single connection.
+    """
+    try:
+        commands = [shlex.split(line, comments=True) for line in sys.stdin]
+    except ValueError:
+        logger.exception("error: invalid command line: ")
+        sys.exit(1)
+
+    commands = [command for command in commands if command]
+    for cmd, *_ in commands:
+        if cmd not in _COMMANDS:
+            logger.error("error: invalid command %r", cmd)
+            sys.exit(1)
+
+    try:
+        with CraftCtl.batch():
+            for cmd, *args in commands:
+                ret = CraftCtl.run(cmd, args)
+                if ret:
+                    print(ret)
+    except RuntimeError:
+        logger.exception("error: ")
+        sys.exit(1)
@@ -42,6 +42,12 @@ from .migration import migrate_files
 
 logger = logging.getLogger(__name__)
 
+# Leading byte of framed ctl requests, see craft_parts.ctl.
+_CTL_REQUEST_MARKER = b"\x1e"
+
+# Size limit of a single framed ctl request.
+_CTL_MAX_REQUEST_SIZE = 1024 * 1024
+
 Stream = TextIO | int | None
 
 
@@ -418,26 +424,77 @@ class StepHandler:
 
         def accept(sock: socket.socket, _mask: int) -> None:
             conn, _ = sock.accept()
-            selector.register(conn, selectors.EVENT_READ, read)
+            selector.register(
+                conn,
+                selectors.EVENT_READ,
+                functools.partial(read, bytearray(), first=True),
+            )
 
-        def read(conn: socket.socket, _mask: int) -> None:
+        def read(
+            pending: bytearray, conn: socket.socket, _mask: int, *, first: bool = False
+        ) -> None:
             data = conn.recv(1024)
-            logger.debug(f"ctl server received: {data!s}")
+            logger.debug("ctl server received: %s", data)
             if not data:
                 selector.unregister(conn)
                 conn.close()
                 return
 
+            if first:
+                # A request can span several reads, and batching clients send
+                # several requests at once, so keep the unprocessed data around.
+                selector.modify(
+                    conn, selectors.EVENT_READ, functools.partial(read, pending)
+                )
+                # Clients that predate request framing send a single unmarked
+                # request without a trailing newline, and wait for its reply.
+                if not data.startswith(_CTL_REQUEST_MARKER):
+                    conn.sendall(reply(data, framed=False))
+                    return
+
+            # Only the received data can complete the pending request.
+            start = len(pending)
+            pending += data
+            while pending.startswith(_CTL_REQUEST_MARKER):
+                end = pending.find(b"\n", start)
+                if end < 0:
+                    break
+                request = pending[len(_CTL_REQUEST_MARKER) : end]
+                del pending[: end + 1]
+                start = 0
+                conn.sendall(reply(request, framed=True))
+
+            if pending and not pending.startswith(_CTL_REQUEST_MARKER):
+                raise RuntimeError(
+                    f"{scriptlet_name!r} scriptlet sent a control request "
+                    "without a request marker"
+                )
+
+            if len(pending) > _CTL_MAX_REQUEST_SIZE:
+                raise RuntimeError(
+                    f"{scriptlet_name!r} scriptlet sent a control request "
+                    f"larger than {_CTL_MAX_REQUEST_SIZE} bytes"
+                )
+
+        def reply(request: bytes | bytearray, *, framed: bool) -> bytes:
             try:
                 retval = self._handle_control_api(
-                    step, scriptlet_name, data.decode("utf-8")
+                    step, scriptlet_name, request.decode("utf-8")
                 )
-                conn.send((f"OK {retval!s}\n" if retval else "OK\n").encode())
+                status = "OK"
             except errors.PluginBuildError:
                 # If craftctl default raises PluginBuildError, pass it upwards.
                 raise
             except errors.PartsError as error:
-                conn.send(f"ERR {error!s}\n".encode())
+                retval = str(error)
+                status = "ERR"
+
+            if not retval:
+                return f"{status}\n".encode()
+
+            # Framed replies must fit in a single line.
+            message = json.dumps(retval) if framed else retval
+            return f"{status} {message}\n".encode()
 
         selector.register(stream, selectors.EVENT_READ, accept)
 
@@ -16,10 +16,11 @@
 
 """The Ant plugin."""
 
+import functools
+import itertools
 import logging
 import os
 import shlex
-from collections.abc import Iterator
 from typing import Literal, cast
 from urllib.parse import urlsplit
 
@@ -137,9 +138,8 @@ class AntPlugin(JavaPlugin):
         # help as much as it should.  (java.net.useSystemProxies=true ought
         # to do the trick, but it relies on desktop configuration rather
         # than using the standard environment variables.)
-        ant_opts: list[str] = []
-        ant_opts.extend(_get_proxy_options("http"))
-        ant_opts.extend(_get_proxy_options("https"))
+        ant_opts = _get_proxy_options("http", os.environ.get("http_proxy"))
+        ant_opts += _get_proxy_options("https", os.environ.get("https_proxy"))
         if ant_opts:
             env["ANT_OPTS"] = _shlex_join(ant_opts)
         return env
@@ -149,36 +149,48 @@ class AntPlugin(JavaPlugin):
         """Return a list of commands to run during the build step."""
         options = cast(AntPluginProperties, self._options)
 
-        command = ["ant"]
-
+        command: tuple[str, ...] = ("ant",)
         if options.ant_build_file:
-            command.extend(["-f", options.ant_build_file])
+            command += ("-f", options.ant_build_file)
 
-        for prop_name, prop_value in options.ant_properties.items():
-            command.append(f"-D{prop_name}={prop_value}")
+        properties = (
+            f"-D{prop_name}={prop_value}"
+            for prop_name, prop_value in options.ant_properties.items()
+        )
 
-        command.extend(options.ant_build_targets)
+        command_line = " ".join(
+            itertools.chain(command, properties, options.ant_build_targets)
+        )
 
-        return [" ".join(command), *self._get_java_post_build_commands()]
+        return [command_line, *self._get_java_post_build_commands()]
 
 
-def _get_proxy_options(scheme: str) -> Iterator[str]:
-    proxy = os.environ.get(f"{scheme}_proxy")
-    if proxy:
-        parsed = urlsplit(proxy)
-        if parsed.hostname is not None:
-            yield f"-D{scheme}.proxyHost={parsed.hostname}"
-        if parsed.port is not None:
-            yield f"-D{scheme}.proxyPort={parsed.port}"
-        if parsed.username is not None:
-            yield f"-D{scheme}.proxyUser={parsed.username}"
-        if parsed.password is not None:
-            yield f"-D{scheme}.proxyPassword={parsed.password}"
+@functools.lru_cache(maxsize=8)
+def _get_proxy_options(scheme: str, proxy: str | None) -> tuple[str, ...]:
+    """Obtain the ant properties to use the given proxy.
 
+    :param scheme: The proxy scheme, either ``http`` or ``https``.
+    :param proxy: The proxy URL, as set in the environment.
 
-def _shlex_join(elements: list[str]) -> str:
-    try:
-        return shlex.join(elements)
-    except AttributeError:
-        # Python older than 3.8 does not have shlex.join
-        return " ".join(elements)
+    :return: The ant command line properties.
+    """
+    if not proxy:
+        return ()
+
+    parsed = urlsplit(proxy)
+    options: list[str] = []
+    if parsed.hostname is not None:
+        options.append(f"-D{scheme}.proxyHost={parsed.hostname}")
+    if parsed.port is not None:
+        options.append(f"-D{scheme}.proxyPort={parsed.port}")
+    if parsed.username is not None:
+        options.append(f"-D{scheme}.proxyUser={parsed.username}")
+    if parsed.password is not None:
+        options.append(f"-D{scheme}.proxyPassword={parsed.password}")
+
+    return tuple(options)
+
+
+@functools.lru_cache(maxsize=16)
+def _shlex_join(elements: tuple[str, ...]) -> str:
+    return shlex.join(elements)
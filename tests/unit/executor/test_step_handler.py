@@ -15,11 +15,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import itertools
 import os
+import selectors
+import socket
+import sys
+import tempfile
 from pathlib import Path
 from textwrap import dedent
 
 import pytest
-from craft_parts import errors, plugins, sources
+from craft_parts import ctl, errors, plugins, sources
 from craft_parts.dirs import ProjectDirs
 from craft_parts.executor.environment import generate_step_environment
 from craft_parts.executor.step_handler import (
@@ -32,6 +36,7 @@ from craft_parts.infos import (
     _DEB_TO_TRIPLET,
     PartInfo,
     ProjectInfo,
+    ProjectVarInfo,
     StepInfo,
     _get_host_architecture,
 )
@@ -89,6 +94,12 @@ def _step_handler_for_step(
     )
 
 
+def _dispatch(selector: selectors.BaseSelector) -> None:
+    """Run the ctl server handlers for the pending socket events."""
+    for key, mask in selector.select(timeout=1):
+        key.data(key.fileobj, mask)
+
+
 def get_mode(path) -> int:
     """Shortcut the retrieve the read/write/execute mode for a given path."""
     return os.stat(path).st_mode & 0o777  # noqa: PTH116
@@ -395,3 +406,166 @@ class TestStepHandlerRunScriptlet:
             )
         assert raised.value.stderr is not None
         assert raised.value.stderr.endswith(b"\nuh-oh\n+ false\n")
+
+    def test_run_scriptlet_ctl(self, new_dir, partitions, mocker, capfd):
+        mocker.patch.dict(os.environ, {"PYTHONPATH": str(Path(__file__).parents[3])})
+        project_info = ProjectInfo(
+            project_dirs=self._dirs,
+            application_name="test",
+            cache_dir=new_dir,
+            project_vars=ProjectVarInfo.unmarshal(
+                {"a": {"part-name": "p1"}, "b": {"part-name": "p1"}}
+            ),
+            partitions=partitions,
+        )
+        part_info = PartInfo(project_info=project_info, part=self._part)
+        sh = _step_handler_for_step(
+            Step.BUILD,
+            cache_dir=new_dir,
+            part_info=part_info,
+            part=self._part,
+            dirs=self._dirs,
+        )
+        # A batched client and a client that predates request framing.
+        scriptlet = dedent(
+            f"""\
+            {sys.executable} -c '
+            from craft_parts.ctl import CraftCtl
+            with CraftCtl.batch():
+                CraftCtl.run("set", ["a=x"])
+                CraftCtl.run("set", ["b=y"])
+                print(CraftCtl.run("get", ["a"]) + CraftCtl.run("get", ["b"]))
+            '
+            {sys.executable} -c '
+            import os, socket
+            s = socket.socket(socket.AF_UNIX)
+            s.connect(os.environ["PARTS_CTL_SOCKET"])
+            s.sendall(b"{{\\"function\\": \\"get\\", \\"args\\": [\\"a\\"]}}")
+            print(s.recv(1024).decode(), end="")
+            '
+            """
+        )
+
+        sh.run_scriptlet(
+            scriptlet, scriptlet_name="name", step=Step.BUILD, work_dir=new_dir
+        )
+        captured = capfd.readouterr()
+        assert captured.out == "xy\nOK x\n"
+
+    @pytest.fixture
+    def ctl_client(self, new_dir):
+        sh = _step_handler_for_step(
+            Step.BUILD,
+            cache_dir=new_dir,
+            part_info=self._part_info,
+            part=self._part,
+            dirs=self._dirs,
+        )
+        with (
+            tempfile.TemporaryDirectory() as tempdir,
+            socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server,
+            socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client,
+        ):
+            ctl_socket_path = os.path.join(tempdir, "craftctl.socket")  # noqa: PTH118
+            server.bind(ctl_socket_path)
+            server.listen(1)
+            selector = sh._ctl_server_selector(Step.BUILD, "name", server)
+            client.connect(ctl_socket_path)
+            _dispatch(selector)
+            yield selector, client
+            selector.close()
+
+    def test_ctl_server_request_at_read_boundary(self, ctl_client):
+        selector, client = ctl_client
+        # A framed request whose newline only arrives in the next server read.
+        head = b'\x1e{"function": "set", "args": ["'
+        tail = b'"]}'
+        request = head + b"a" * (1024 - len(head) - len(tail)) + tail
+        assert len(request) == 1024
+
+        client.sendall(request)
+        _dispatch(selector)
+        client.setblocking(False)
+        with pytest.raises(BlockingIOError):
+            client.recv(4096)
+
+        client.sendall(b"\n")
+        _dispatch(selector)
+        client.setblocking(True)
+        response = client.recv(4096)
+
+        assert response.endswith(b"\n")
+        assert response.count(b"\n") == 1
+        with pytest.raises(RuntimeError) as raised:
+            ctl._parse_response(response)
+        assert str(raised.value) == (
+            "'name' in part 'p1' executed an invalid control API call: "
+            "invalid arguments to command 'set' (want key=value).\n"
+            "Review the scriptlet and make sure it's correct."
+        )
+
+    def test_ctl_server_invalid_unframed_request(self, ctl_client):
+        selector, client = ctl_client
+
+        client.sendall(b'{"function": "get"')
+
+        with pytest.raises(RuntimeError) as raised:
+            _dispatch(selector)
+        assert str(raised.value) == (
+            '\'name\' scriptlet called a function with invalid json: {"function": "get"'
+        )
+
+    def test_ctl_server_unmarked_request(self, ctl_client):
+        selector, client = ctl_client
+
+        client.sendall(b'\x1e{"function": "get", "args": ["a"]}\n{"function"')
+
+        with pytest.raises(RuntimeError) as raised:
+            _dispatch(selector)
+        assert str(raised.value) == (
+            "'name' scriptlet sent a control request without a request marker"
+        )
+
+    def test_ctl_server_request_too_large(self, ctl_client, mocker):
+        mocker.patch("craft_parts.executor.step_handler._CTL_MAX_REQUEST_SIZE", 1500)
+        selector, client = ctl_client
+
+        client.sendall(b"\x1e" + b"a" * 1023)
+        _dispatch(selector)
+        client.sendall(b"a" * 1024)
+
+        with pytest.raises(RuntimeError) as raised:
+            _dispatch(selector)
+        assert str(raised.value) == (
+            "'name' scriptlet sent a control request larger than 1500 bytes"
+        )
+
+    def test_run_scriptlet_ctl_error(self, new_dir, mocker):
+        mocker.patch.dict(os.environ, {"PYTHONPATH": str(Path(__file__).parents[3])})
+        sh = _step_handler_for_step(
+            Step.BUILD,
+            cache_dir=new_dir,
+            part_info=self._part_info,
+            part=self._part,
+            dirs=self._dirs,
+        )
+        scriptlet = dedent(
+            f"""\
+            {sys.executable} -c '
+            from craft_parts.ctl import CraftCtl
+            with CraftCtl.batch():
+                CraftCtl.run("set", ["a"])
+            '
+            """
+        )
+
+        with pytest.raises(errors.ScriptletRunError) as raised:
+            sh.run_scriptlet(
+                scriptlet, scriptlet_name="name", step=Step.BUILD, work_dir=new_dir
+            )
+        assert raised.value.stderr is not None
+        assert (
+            b"RuntimeError: 'name' in part 'p1' executed an invalid control API call: "
+            b"invalid arguments to command 'set' (want key=value).\n"
+            b"Review the scriptlet and make sure it's correct.\n"
+        ) in raised.value.stderr
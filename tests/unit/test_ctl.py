@@ -14,44 +14,133 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import importlib
+import io
+import json
 import os
+import sys
+import threading
 
 import pytest
+from craft_parts import ctl
 from craft_parts.ctl import CraftCtl
 
 
 class _FakeSocket:
     def __init__(self, recv: bytes):
-        self._buffer = recv
+        self._responses = recv.splitlines(keepends=True)
+        self._replied = 0
+        self._buffer = b""
         self.data: bytes = b""
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
     def listen(self, n: int):
         pass
 
-    def send(self, data: bytes) -> None:
-        self.data = data
+    def sendall(self, data: bytes) -> None:
+        self.data += data
 
-    def recv(self, n: int) -> bytes:
-        return self._buffer
+    def recv_into(self, buffer: bytearray) -> int:
+        # Like the ctl server, only respond to the requests already sent.
+        requests = self.data.count(b"\n")
+        self._buffer += b"".join(self._responses[self._replied : requests])
+        self._replied = max(self._replied, requests)
+        nbytes = min(len(buffer), len(self._buffer))
+        buffer[:nbytes] = self._buffer[:nbytes]
+        self._buffer = self._buffer[nbytes:]
+        return nbytes
 
     def connect(self, path: str):
         pass
 
 
+def _decode_requests(data: bytes) -> list:
+    """Decode the framed requests sent by the client."""
+    assert data.endswith(b"\n")
+    requests = data.splitlines()
+    assert all(request.startswith(b"\x1e") for request in requests)
+    return [json.loads(request[1:]) for request in requests]
+
+
+@pytest.fixture
+def ctl_without_orjson(mocker):
+    mocker.patch.dict(sys.modules, {"orjson": None})
+    yield importlib.reload(ctl)
+    mocker.stopall()
+    importlib.reload(ctl)
+
+
+class TestEncoder:
+    """Verify the ctl request encoders."""
+
+    def test_orjson_encoder(self, mocker):
+        pytest.importorskip("orjson")
+        spy = mocker.spy(ctl, "_orjson_dumps")
+
+        assert ctl._json_dumps(["a=b"]) == b'["a=b"]'
+        spy.assert_called_once_with(["a=b"])
+
+    def test_orjson_encoder_surrogates(self, new_dir, mocker):
+        pytest.importorskip("orjson")
+        fake_socket = _FakeSocket(b"OK\n")
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+        # Arguments that aren't valid UTF-8 are decoded with surrogate escapes.
+        arg = os.fsdecode(b"a=\xff")
+
+        CraftCtl.run("set", [arg])
+
+        assert _decode_requests(fake_socket.data) == [
+            {"function": "set", "args": [arg]}
+        ]
+
+    def test_stdlib_encoder(self, new_dir, mocker, ctl_without_orjson):
+        fake_socket = _FakeSocket(b"OK\n")
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        ctl_without_orjson.CraftCtl.run("set", ["a=b"])
+
+        assert ctl_without_orjson._json_dumps(["a=b"]) == b'["a=b"]'
+        assert _decode_requests(fake_socket.data) == [
+            {"function": "set", "args": ["a=b"]}
+        ]
+
+
 class TestClient:
     """Verify the ctl client."""
 
     def test_call_command(self, new_dir, mocker):
-        fake_socket = _FakeSocket(b"")
+        fake_socket = _FakeSocket(b"OK\n")
         mocker.patch("socket.socket", return_value=fake_socket)
         mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
 
         CraftCtl.run("default", ["whatever"])
 
-        assert fake_socket.data == b'{"function": "default", "args": ["whatever"]}'
+        assert _decode_requests(fake_socket.data) == [
+            {"function": "default", "args": ["whatever"]},
+        ]
+
+    def test_call_command_with_cached_ctl_socket(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b"OK\n")
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch("craft_parts.ctl._CTL_SOCKET_PATH", "fake")
+        spy = mocker.spy(fake_socket, "connect")
+
+        CraftCtl.run("set", ['a="b"'])
+
+        spy.assert_called_once_with("fake")
+        assert _decode_requests(fake_socket.data) == [
+            {"function": "set", "args": ['a="b"']}
+        ]
 
     def test_call_command_with_ok_feedback(self, new_dir, mocker):
-        fake_socket = _FakeSocket(b"OK hello there!")
+        fake_socket = _FakeSocket(b'OK "hello there!"\n')
         mocker.patch("socket.socket", return_value=fake_socket)
         mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
 
@@ -59,8 +148,26 @@ class TestClient:
 
         assert retval == "hello there!"
 
+    def test_call_command_with_long_feedback(self, new_dir, mocker):
+        value = "x" * 10000
+        fake_socket = _FakeSocket(f'OK "{value}"\n'.encode())
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        retval = CraftCtl.run("get", ["whatever"])
+
+        assert retval == value
+
+    def test_receive_buffer_per_thread(self):
+        buffers = []
+        thread = threading.Thread(target=lambda: buffers.append(ctl._local.recv_buf))
+        thread.start()
+        thread.join()
+
+        assert buffers[0] is not ctl._local.recv_buf
+
     def test_call_command_with_error_feedback(self, new_dir, mocker):
-        fake_socket = _FakeSocket(b"ERR hello there!")
+        fake_socket = _FakeSocket(b'ERR "hello there!"\n')
         mocker.patch("socket.socket", return_value=fake_socket)
         mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
 
@@ -69,8 +176,54 @@ class TestClient:
 
         assert str(raised.value) == "hello there!"
 
+    def test_call_command_with_multiline_feedback(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b'ERR "hello\\nthere!"\n')
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        with pytest.raises(RuntimeError) as raised:
+            CraftCtl.run("default", [])
+
+        assert str(raised.value) == "hello\nthere!"
+
+    def test_call_command_with_unexpected_feedback(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b"hello there!\n")
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        with pytest.raises(RuntimeError) as raised:
+            CraftCtl.run("default", [])
+
+        assert str(raised.value) == "unexpected ctl server response b'hello there!'"
+
+    @pytest.mark.parametrize(
+        "response",
+        [b"OK hello there!", b"ERR hello there!", b'OK "hello', b"OK 42"],
+    )
+    def test_call_command_with_unframed_feedback(self, new_dir, mocker, response):
+        fake_socket = _FakeSocket(response + b"\n")
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        with pytest.raises(RuntimeError) as raised:
+            CraftCtl.run("get", ["whatever"])
+
+        assert str(raised.value) == f"unexpected ctl server response {response!r}"
+
+    def test_call_command_without_response(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b"")
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        with pytest.raises(RuntimeError) as raised:
+            CraftCtl.run("default", [])
+
+        assert str(raised.value) == (
+            "ctl server closed the connection after 0 of 1 responses"
+        )
+
     def test_call_command_without_ctl_socket(self, new_dir, mocker):
-        fake_socket = _FakeSocket(b"OK hello there!")
+        fake_socket = _FakeSocket(b'OK "hello there!"\n')
         mocker.patch("socket.socket", return_value=fake_socket)
 
         with pytest.raises(RuntimeError) as raised:
@@ -86,3 +239,144 @@ class TestClient:
             CraftCtl.run("grok", ["whatever"])
 
         assert str(raised.value) == "invalid command 'grok'"
+
+
+class TestBatch:
+    """Verify batched ctl client calls."""
+
+    def test_batch_commands(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b"OK\nOK\n")
+        mock_socket = mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        with CraftCtl.batch():
+            CraftCtl.run("set", ["a=1"])
+            CraftCtl.run("set", ["b=2"])
+            assert fake_socket.data == b""
+
+        assert mock_socket.call_count == 1
+        assert _decode_requests(fake_socket.data) == [
+            {"function": "set", "args": ["a=1"]},
+            {"function": "set", "args": ["b=2"]},
+        ]
+
+    def test_batch_get_flushes(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b'OK\nOK "1"\n')
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        with CraftCtl.batch():
+            CraftCtl.run("set", ["a=1"])
+            retval = CraftCtl.run("get", ["a"])
+            assert len(fake_socket.data.splitlines()) == 2
+
+        assert retval == "1"
+
+    def test_batch_error(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b'ERR "hello there!"\nOK\n')
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        def run_batch():
+            with CraftCtl.batch():
+                CraftCtl.run("set", ["a=1"])
+                CraftCtl.run("set", ["b=2"])
+
+        with pytest.raises(RuntimeError) as raised:
+            run_batch()
+
+        assert str(raised.value) == "hello there!"
+
+    def test_batch_missing_responses(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b"OK\n")
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        def run_batch():
+            with CraftCtl.batch():
+                CraftCtl.run("set", ["a=1"])
+                CraftCtl.run("default", [])
+
+        with pytest.raises(RuntimeError) as raised:
+            run_batch()
+
+        assert str(raised.value) == (
+            "ctl server closed the connection after 1 of 2 responses"
+        )
+
+    def test_batch_nested(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b"OK\nOK\n")
+        mock_socket = mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+
+        with CraftCtl.batch():
+            CraftCtl.run("set", ["a=1"])
+            with CraftCtl.batch():
+                CraftCtl.run("set", ["b=2"])
+            assert fake_socket.data == b""
+
+        assert mock_socket.call_count == 1
+        assert len(fake_socket.data.splitlines()) == 2
+
+    def test_batch_without_ctl_socket(self, new_dir):
+        with pytest.raises(RuntimeError) as raised, CraftCtl.batch():
+            pass
+
+        assert str(raised.value).startswith(
+            "'PARTS_CTL_SOCKET' environment variable must be defined."
+        )
+
+
+class TestMainBatch:
+    """Verify the batched ctl client cli."""
+
+    def test_main_batch(self, new_dir, mocker, capsys):
+        fake_socket = _FakeSocket(b'OK\nOK "1 2"\nOK\n')
+        mock_socket = mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+        mocker.patch.object(
+            sys, "stdin", io.StringIO("set a='1 2'\n\n# comment\nget a\nset b=3\n")
+        )
+
+        ctl.main_batch()
+
+        assert mock_socket.call_count == 1
+        assert _decode_requests(fake_socket.data) == [
+            {"function": "set", "args": ["a=1 2"]},
+            {"function": "get", "args": ["a"]},
+            {"function": "set", "args": ["b=3"]},
+        ]
+        assert capsys.readouterr().out == "1 2\n"
+
+    def test_main_batch_error(self, new_dir, mocker):
+        fake_socket = _FakeSocket(b'ERR "hello there!"\n')
+        mocker.patch("socket.socket", return_value=fake_socket)
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+        mocker.patch.object(sys, "stdin", io.StringIO("set a\n"))
+
+        with pytest.raises(SystemExit) as raised:
+            ctl.main_batch()
+
+        assert raised.value.code == 1
+
+    def test_main_batch_invalid_line(self, new_dir, mocker):
+        mock_socket = mocker.patch("socket.socket")
+        mocker.patch.object(sys, "stdin", io.StringIO("set a=1\nset 'b=2\n"))
+
+        with pytest.raises(SystemExit) as raised:
+            ctl.main_batch()
+
+        assert raised.value.code == 1
+        mock_socket.assert_not_called()
+
+    def test_main_batch_invalid_command(self, new_dir, mocker, caplog):
+        mock_socket = mocker.patch("socket.socket")
+        mocker.patch.dict(os.environ, {"PARTS_CTL_SOCKET": "fake"})
+        mocker.patch.object(sys, "stdin", io.StringIO("get a\nset a=1\nbogus\n"))
+
+        with pytest.raises(SystemExit) as raised:
+            ctl.main_batch()
+
+        assert raised.value.code == 1
+        assert "invalid command 'bogus'" in caplog.text
+        mock_socket.assert_not_called()
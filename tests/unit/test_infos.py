@@ -55,6 +55,7 @@ LINUX_ARCHS = [
     ("s390x", "s390x", "s390x-linux-gnu", True),
     ("x86_64", "amd64", "x86_64-linux-gnu", True),
 ]
+LINUX_ARCH_IDS = [machine for machine, *_ in LINUX_ARCHS]
 
 
 @pytest.fixture
@@ -63,7 +64,9 @@ def mock_logger(mocker):
 
 
 @pytest.mark.parametrize(
-    ("tc_arch", "tc_target_arch", "tc_triplet", "tc_cross"), LINUX_ARCHS
+    ("tc_arch", "tc_target_arch", "tc_triplet", "tc_cross"),
+    LINUX_ARCHS,
+    ids=LINUX_ARCH_IDS,
 )
 def test_project_info(mocker, new_dir, tc_arch, tc_target_arch, tc_triplet, tc_cross):
     mocker.patch("platform.machine", return_value=_MOCK_NATIVE_ARCH)
@@ -107,6 +110,22 @@ def test_project_info(mocker, new_dir, tc_arch, tc_target_arch, tc_triplet, tc_c
     assert x.prime_dir == new_dir / "prime"
 
 
+@pytest.mark.parametrize(
+    "name",
+    [
+        "arch_triplet",
+        "arch_triplet_build_on",
+        "arch_triplet_build_for",
+        "is_cross_compiling",
+    ],
+)
+def test_project_info_read_only_arch(new_dir, name):
+    x = ProjectInfo(application_name="test", cache_dir=new_dir)
+
+    with pytest.raises(AttributeError):
+        setattr(x, name, "x")
+
+
 @pytest.mark.parametrize(
     ("machine_arch", "expected_arch"),
     [
@@ -119,7 +138,9 @@ def test_project_info(mocker, new_dir, tc_arch, tc_target_arch, tc_triplet, tc_c
     ],
 )
 @pytest.mark.parametrize(
-    ("tc_arch", "tc_target_arch", "tc_triplet", "unused_tc_cross"), LINUX_ARCHS
+    ("tc_arch", "tc_target_arch", "tc_triplet", "unused_tc_cross"),
+    LINUX_ARCHS,
+    ids=LINUX_ARCH_IDS,
 )
 def test_project_info_translated_arch(  # pylint: disable=too-many-arguments
     mocker,